@@ -1,191 +1,290 @@
 import streamlit as st
+import pandas as pd
 import sqlite3
 from datetime import datetime
 import hashlib
 import os
+import threading
+from contextlib import contextmanager
 
 # =========================
 # CONFIG
 # =========================
 APP_TITLE = "Car Wash Booking & Live Status"
 DB_PATH = os.getenv("CARWASH_DB_PATH", "carwash.db")  # SQLite default
+PAGE_SIZE = 20  # rows per page for booking lists
 
 # If you want MySQL later, set env vars and adapt connector section (see notes at bottom).
 
 # =========================
 # DB HELPERS (SQLite)
 # =========================
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+def open_conn():
+    # isolation_level=None -> autocommit; writes open their own transaction via transaction().
+    # cached_statements: keep every prepared statement this app uses (default is 128)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, cached_statements=512)
+    conn.execute("PRAGMA journal_mode = WAL;")       # readers don't block the writer
+    conn.execute("PRAGMA synchronous = NORMAL;")     # safe with WAL, far fewer fsyncs
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    conn.execute("PRAGMA cache_size = -64000;")      # ~64 MB page cache
     conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute("PRAGMA mmap_size = 268435456;")    # 256 MB
+    return conn
+
+@st.cache_resource
+def get_conn():
+    # Read connection: one per server process (st.cache_resource), shared by every rerun/session.
+    # A shared autocommit connection is only safe if it never writes: transaction state belongs to
+    # the connection, not the handler, so a write here could land inside another session's
+    # transaction. query_only makes SQLite reject any write on it; writes go through transaction().
+    conn = open_conn()
+    conn.execute("PRAGMA query_only = ON;")
     return conn
 
+@st.cache_resource
+def get_write_conn():
+    # Separate connection for all writes; only used inside transaction().
+    return open_conn()
+
+@st.cache_resource
+def get_write_lock():
+    # The write connection is shared across sessions, so only one may hold a transaction at a time.
+    return threading.Lock()
+
+@contextmanager
+def transaction():
+    # Every write goes through here: takes the write lock, then one explicit transaction on the
+    # write connection (one journal sync instead of one per statement). Commits on success,
+    # rolls back if the block raises. Readers on get_conn() only ever see committed rows.
+    conn = get_write_conn()
+    with get_write_lock():
+        conn.execute("BEGIN IMMEDIATE;")
+        with conn:
+            yield conn
+
 def now_str():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 def hash_password(pw: str) -> str:
-    # Simple SHA256 hashing (good enough for DB project demo)
+    # Simple SHA256 hashing (good enough for DB project demo).
+    # hashlib.sha256 is OpenSSL's implementation (SHA-NI accelerated on CPUs that have it); it only
+    # runs on Login/Create clicks, never per rerun, so there's nothing worth memoizing.
     return hashlib.sha256(pw.encode("utf-8")).hexdigest()
 
+# Default admin password hash, computed once at import instead of inside init_db()
+ADMIN_SEED_HASH = hash_password("admin123")
+
+SCHEMA_SQL = """
+BEGIN;
+
+-- USERS: customer/staff/admin in one table to keep app simple
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    full_name TEXT NOT NULL,
+    phone TEXT NOT NULL UNIQUE,
+    email TEXT UNIQUE,
+    password_hash TEXT NOT NULL,
+    role TEXT NOT NULL CHECK(role IN ('Customer','Staff','Admin')),
+    created_at TEXT NOT NULL
+);
+
+-- VEHICLES
+CREATE TABLE IF NOT EXISTS vehicles (
+    vehicle_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INTEGER NOT NULL,
+    plate_no TEXT NOT NULL UNIQUE,
+    make TEXT,
+    model TEXT,
+    color TEXT,
+    vehicle_type TEXT,
+    FOREIGN KEY(customer_id) REFERENCES users(user_id)
+        ON UPDATE CASCADE ON DELETE RESTRICT
+);
+
+-- PACKAGES
+CREATE TABLE IF NOT EXISTS packages (
+    package_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    package_name TEXT NOT NULL UNIQUE,
+    price REAL NOT NULL CHECK(price >= 0),
+    duration_minutes INTEGER NOT NULL CHECK(duration_minutes > 0),
+    is_active INTEGER NOT NULL DEFAULT 1 CHECK(is_active IN (0,1))
+);
+
+-- SERVICE STAGES
+CREATE TABLE IF NOT EXISTS service_stages (
+    stage_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage_name TEXT NOT NULL UNIQUE,
+    stage_order INTEGER NOT NULL UNIQUE CHECK(stage_order > 0)
+);
+
+-- BOOKINGS
+CREATE TABLE IF NOT EXISTS bookings (
+    booking_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INTEGER NOT NULL,
+    vehicle_id INTEGER NOT NULL,
+    package_id INTEGER NOT NULL,
+    booking_datetime TEXT NOT NULL,
+    scheduled_datetime TEXT,
+    status TEXT NOT NULL CHECK(status IN ('Booked','InProgress','Completed','Cancelled')),
+    current_stage_id INTEGER,
+    notes TEXT,
+
+    FOREIGN KEY(customer_id) REFERENCES users(user_id)
+        ON UPDATE CASCADE ON DELETE RESTRICT,
+    FOREIGN KEY(vehicle_id) REFERENCES vehicles(vehicle_id)
+        ON UPDATE CASCADE ON DELETE RESTRICT,
+    FOREIGN KEY(package_id) REFERENCES packages(package_id)
+        ON UPDATE CASCADE ON DELETE RESTRICT,
+    FOREIGN KEY(current_stage_id) REFERENCES service_stages(stage_id)
+        ON UPDATE CASCADE ON DELETE SET NULL
+);
+
+-- STAGE HISTORY
+CREATE TABLE IF NOT EXISTS booking_stage_history (
+    history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    booking_id INTEGER NOT NULL,
+    stage_id INTEGER NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT,
+    updated_by_staff_id INTEGER NOT NULL,
+
+    FOREIGN KEY(booking_id) REFERENCES bookings(booking_id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    FOREIGN KEY(stage_id) REFERENCES service_stages(stage_id)
+        ON UPDATE CASCADE ON DELETE RESTRICT,
+    FOREIGN KEY(updated_by_staff_id) REFERENCES users(user_id)
+        ON UPDATE CASCADE ON DELETE RESTRICT
+);
+
+-- STAFF ASSIGNMENT (M:N)
+CREATE TABLE IF NOT EXISTS booking_staff_assignment (
+    booking_id INTEGER NOT NULL,
+    staff_id INTEGER NOT NULL,
+    assigned_at TEXT NOT NULL,
+    PRIMARY KEY(booking_id, staff_id),
+    FOREIGN KEY(booking_id) REFERENCES bookings(booking_id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    FOREIGN KEY(staff_id) REFERENCES users(user_id)
+        ON UPDATE CASCADE ON DELETE RESTRICT
+);
+
+-- PAYMENT (1:1 with booking)
+CREATE TABLE IF NOT EXISTS payments (
+    payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    booking_id INTEGER NOT NULL UNIQUE,
+    amount REAL NOT NULL CHECK(amount >= 0),
+    method TEXT NOT NULL CHECK(method IN ('Cash','Card','Online')),
+    payment_status TEXT NOT NULL CHECK(payment_status IN ('Unpaid','Paid','Partial','Refunded')),
+    paid_at TEXT,
+
+    FOREIGN KEY(booking_id) REFERENCES bookings(booking_id)
+        ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+-- Every new booking gets its unpaid payment row (priced from its package) in the same statement
+CREATE TRIGGER IF NOT EXISTS trg_bookings_create_payment
+AFTER INSERT ON bookings
+BEGIN
+    INSERT INTO payments(booking_id, amount, method, payment_status, paid_at)
+    SELECT NEW.booking_id, p.price, 'Cash', 'Unpaid', NULL
+    FROM packages p
+    WHERE p.package_id = NEW.package_id;
+END;
+
+-- INDEXES for dashboard filters/joins (PK/UNIQUE columns, incl. booking_staff_assignment(booking_id, staff_id), are already indexed)
+CREATE INDEX IF NOT EXISTS idx_bookings_customer ON bookings(customer_id, booking_id DESC);
+CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status, booking_id);
+CREATE INDEX IF NOT EXISTS idx_vehicles_customer ON vehicles(customer_id);
+CREATE INDEX IF NOT EXISTS idx_history_booking ON booking_stage_history(booking_id, history_id DESC);
+
+COMMIT;
+"""
+
+# Hot write statements, kept as constants so every call site reuses the same prepared statement
+SQL_INSERT_BOOKING = """
+INSERT INTO bookings(customer_id, vehicle_id, package_id, booking_datetime, scheduled_datetime, status, current_stage_id, notes)
+VALUES(?,?,?,?,?,?,?,?)
+RETURNING booking_id
+"""
+
+SQL_END_STAGE = """
+UPDATE booking_stage_history
+SET end_time=?
+WHERE booking_id=? AND stage_id=? AND end_time IS NULL
+"""
+
+SQL_UPDATE_BOOKING_STAGE = """
+UPDATE bookings
+SET current_stage_id=?, status=?
+WHERE booking_id=?
+"""
+
+SQL_INSERT_STAGE_HISTORY = """
+INSERT INTO booking_stage_history(booking_id, stage_id, start_time, end_time, updated_by_staff_id)
+VALUES(?,?,?,?,?)
+"""
+
+SQL_INSERT_ASSIGNMENT = """
+INSERT OR IGNORE INTO booking_staff_assignment(booking_id, staff_id, assigned_at)
+VALUES(?,?,?)
+"""
+
 def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
+    # All DDL in one executescript call (one parse + one transaction instead of one per table)
+    with get_write_lock():
+        get_write_conn().executescript(SCHEMA_SQL)
+
+    with transaction() as conn:
+        cur = conn.cursor()
 
-    # USERS: customer/staff/admin in one table to keep app simple
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        full_name TEXT NOT NULL,
-        phone TEXT NOT NULL UNIQUE,
-        email TEXT UNIQUE,
-        password_hash TEXT NOT NULL,
-        role TEXT NOT NULL CHECK(role IN ('Customer','Staff','Admin')),
-        created_at TEXT NOT NULL
-    );
-    """)
-
-    # VEHICLES
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS vehicles (
-        vehicle_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        customer_id INTEGER NOT NULL,
-        plate_no TEXT NOT NULL UNIQUE,
-        make TEXT,
-        model TEXT,
-        color TEXT,
-        vehicle_type TEXT,
-        FOREIGN KEY(customer_id) REFERENCES users(user_id)
-            ON UPDATE CASCADE ON DELETE RESTRICT
-    );
-    """)
-
-    # PACKAGES
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS packages (
-        package_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        package_name TEXT NOT NULL UNIQUE,
-        price REAL NOT NULL CHECK(price >= 0),
-        duration_minutes INTEGER NOT NULL CHECK(duration_minutes > 0),
-        is_active INTEGER NOT NULL DEFAULT 1 CHECK(is_active IN (0,1))
-    );
-    """)
-
-    # SERVICE STAGES
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS service_stages (
-        stage_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        stage_name TEXT NOT NULL UNIQUE,
-        stage_order INTEGER NOT NULL UNIQUE CHECK(stage_order > 0)
-    );
-    """)
-
-    # BOOKINGS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS bookings (
-        booking_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        customer_id INTEGER NOT NULL,
-        vehicle_id INTEGER NOT NULL,
-        package_id INTEGER NOT NULL,
-        booking_datetime TEXT NOT NULL,
-        scheduled_datetime TEXT,
-        status TEXT NOT NULL CHECK(status IN ('Booked','InProgress','Completed','Cancelled')),
-        current_stage_id INTEGER,
-        notes TEXT,
-
-        FOREIGN KEY(customer_id) REFERENCES users(user_id)
-            ON UPDATE CASCADE ON DELETE RESTRICT,
-        FOREIGN KEY(vehicle_id) REFERENCES vehicles(vehicle_id)
-            ON UPDATE CASCADE ON DELETE RESTRICT,
-        FOREIGN KEY(package_id) REFERENCES packages(package_id)
-            ON UPDATE CASCADE ON DELETE RESTRICT,
-        FOREIGN KEY(current_stage_id) REFERENCES service_stages(stage_id)
-            ON UPDATE CASCADE ON DELETE SET NULL
-    );
-    """)
-
-    # STAGE HISTORY
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS booking_stage_history (
-        history_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        booking_id INTEGER NOT NULL,
-        stage_id INTEGER NOT NULL,
-        start_time TEXT NOT NULL,
-        end_time TEXT,
-        updated_by_staff_id INTEGER NOT NULL,
-
-        FOREIGN KEY(booking_id) REFERENCES bookings(booking_id)
-            ON UPDATE CASCADE ON DELETE CASCADE,
-        FOREIGN KEY(stage_id) REFERENCES service_stages(stage_id)
-            ON UPDATE CASCADE ON DELETE RESTRICT,
-        FOREIGN KEY(updated_by_staff_id) REFERENCES users(user_id)
-            ON UPDATE CASCADE ON DELETE RESTRICT
-    );
-    """)
-
-    # STAFF ASSIGNMENT (M:N)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS booking_staff_assignment (
-        booking_id INTEGER NOT NULL,
-        staff_id INTEGER NOT NULL,
-        assigned_at TEXT NOT NULL,
-        PRIMARY KEY(booking_id, staff_id),
-        FOREIGN KEY(booking_id) REFERENCES bookings(booking_id)
-            ON UPDATE CASCADE ON DELETE CASCADE,
-        FOREIGN KEY(staff_id) REFERENCES users(user_id)
-            ON UPDATE CASCADE ON DELETE RESTRICT
-    );
-    """)
-
-    # PAYMENT (1:1 with booking)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS payments (
-        payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        booking_id INTEGER NOT NULL UNIQUE,
-        amount REAL NOT NULL CHECK(amount >= 0),
-        method TEXT NOT NULL CHECK(method IN ('Cash','Card','Online')),
-        payment_status TEXT NOT NULL CHECK(payment_status IN ('Unpaid','Paid','Partial','Refunded')),
-        paid_at TEXT,
-
-        FOREIGN KEY(booking_id) REFERENCES bookings(booking_id)
-            ON UPDATE CASCADE ON DELETE CASCADE
-    );
-    """)
-
-    # Seed default stages
-    cur.execute("SELECT COUNT(*) FROM service_stages;")
-    if cur.fetchone()[0] == 0:
+        # Seed default stages / packages only into an empty table (one statement each, no COUNT probe)
         stages = [("Washing", 1), ("Drying", 2), ("Polishing", 3), ("Completed", 4)]
-        cur.executemany("INSERT INTO service_stages(stage_name, stage_order) VALUES(?, ?);", stages)
+        cur.execute(f"""
+        INSERT INTO service_stages(stage_name, stage_order)
+        SELECT * FROM (VALUES {",".join(["(?,?)"] * len(stages))})
+        WHERE NOT EXISTS (SELECT 1 FROM service_stages);
+        """, [v for row in stages for v in row])
 
-    # Seed some packages (optional)
-    cur.execute("SELECT COUNT(*) FROM packages;")
-    if cur.fetchone()[0] == 0:
+        # Seed some packages (optional)
         pkgs = [
             ("Basic Wash", 500, 20, 1),
             ("Standard Wash", 800, 35, 1),
             ("Premium Wash", 1200, 50, 1),
         ]
-        cur.executemany(
-            "INSERT INTO packages(package_name, price, duration_minutes, is_active) VALUES(?,?,?,?);",
-            pkgs
-        )
-
-    # Seed an admin if none exists
-    cur.execute("SELECT COUNT(*) FROM users WHERE role='Admin';")
-    if cur.fetchone()[0] == 0:
-        cur.execute("""
-        INSERT INTO users(full_name, phone, email, password_hash, role, created_at)
-        VALUES(?,?,?,?,?,?);
-        """, ("Admin", "0300-0000000", "admin@carwash.local", hash_password("admin123"), "Admin", now_str()))
+        cur.execute(f"""
+        INSERT INTO packages(package_name, price, duration_minutes, is_active)
+        SELECT * FROM (VALUES {",".join(["(?,?,?,?)"] * len(pkgs))})
+        WHERE NOT EXISTS (SELECT 1 FROM packages);
+        """, [v for row in pkgs for v in row])
 
-    conn.commit()
-    conn.close()
+        # Seed an admin if none exists (one statement, no separate COUNT probe)
+        cur.execute("""
+        INSERT OR IGNORE INTO users(full_name, phone, email, password_hash, role, created_at)
+        SELECT ?,?,?,?,?,?
+        WHERE NOT EXISTS (SELECT 1 FROM users WHERE role='Admin');
+        """, ("Admin", "0300-0000000", "admin@carwash.local", ADMIN_SEED_HASH, "Admin", now_str()))
+
+@st.cache_resource
+def init_db_once():
+    # Streamlit re-executes main() on every rerun; schema/seed work only needs to happen once per server process.
+    init_db()
+    return True
 
 def q(conn, sql, params=()):
     cur = conn.cursor()
     cur.execute(sql, params)
     return cur
 
+# Read-only query results keyed by SQL + params, shared across reruns/sessions for a few seconds.
+# Every write handler calls run_select.clear(), so nobody waits out the TTL to see a change.
+@st.cache_data(ttl=5, show_spinner=False)
+def run_select(sql, params=()):
+    return q(get_conn(), sql, params).fetchall()
+
+def run_select_one(sql, params=()):
+    rows = run_select(sql, params)
+    return rows[0] if rows else None
+
 # =========================
 # AUTH
 # =========================
@@ -194,22 +293,18 @@ def login(phone, password):
     cur = q(conn, "SELECT user_id, full_name, role FROM users WHERE phone=? AND password_hash=?",
             (phone, hash_password(password)))
     row = cur.fetchone()
-    conn.close()
     return row  # (id, name, role) or None
 
 def register_customer(full_name, phone, email, password):
-    conn = get_conn()
     try:
-        q(conn, """
-        INSERT INTO users(full_name, phone, email, password_hash, role, created_at)
-        VALUES(?,?,?,?, 'Customer', ?)
-        """, (full_name, phone, email if email else None, hash_password(password), now_str()))
-        conn.commit()
+        with transaction() as conn:
+            q(conn, """
+            INSERT INTO users(full_name, phone, email, password_hash, role, created_at)
+            VALUES(?,?,?,?, 'Customer', ?)
+            """, (full_name, phone, email if email else None, hash_password(password), now_str()))
         return True, "Registered successfully. Please login."
     except sqlite3.IntegrityError as e:
         return False, f"Registration failed: {e}"
-    finally:
-        conn.close()
 
 # =========================
 # UI HELPERS
@@ -222,26 +317,43 @@ def require_login():
 def is_staff_or_admin():
     return st.session_state["user"]["role"] in ("Staff", "Admin")
 
-def get_stage_list(conn):
-    cur = q(conn, "SELECT stage_id, stage_name FROM service_stages ORDER BY stage_order")
+# Keyset pagination: st.session_state[key] is a stack of cursors, one per page already passed
+# (the last booking_id shown on it). Queries use "booking_id </> cursor LIMIT PAGE_SIZE+1",
+# so no OFFSET scan; the extra row only tells us whether a next page exists.
+def page_cursor(key, default):
+    stack = st.session_state.get(key)
+    return stack[-1] if stack else default
+
+def page_buttons(key, rows, has_more, scope="app"):
+    stack = st.session_state.setdefault(key, [])
+    c1, c2 = st.columns(2)
+    if stack and c1.button("Previous page", key=f"{key}_prev"):
+        stack.pop()
+        st.rerun(scope=scope)
+    if has_more and c2.button("Next page", key=f"{key}_next"):
+        stack.append(rows[-1][0])
+        st.rerun(scope=scope)
+
+# Reference data changes rarely (stages are seeded once), so cache it across reruns/sessions.
+@st.cache_data(ttl=300)
+def get_stage_list():
+    cur = q(get_conn(), "SELECT stage_id, stage_name, stage_order FROM service_stages ORDER BY stage_order")
     return cur.fetchall()
 
-def get_active_packages(conn):
-    cur = q(conn, "SELECT package_id, package_name, price, duration_minutes FROM packages WHERE is_active=1 ORDER BY price")
+@st.cache_data(ttl=300)
+def get_active_packages():
+    cur = q(get_conn(), "SELECT package_id, package_name, price, duration_minutes FROM packages WHERE is_active=1 ORDER BY price")
     return cur.fetchall()
 
 # =========================
 # CUSTOMER PAGES
 # =========================
-def page_customer_dashboard():
-    st.subheader("Customer Dashboard")
-    user_id = st.session_state["user"]["user_id"]
-
-    conn = get_conn()
-
+# Each section is an st.fragment: widget interactions inside one rerun only that section.
+# Writes that other sections must see (new vehicle, new booking) still trigger a full rerun.
+@st.fragment
+def vehicles_fragment(user_id):
     st.markdown("### My Vehicles")
-    cur = q(conn, "SELECT vehicle_id, plate_no, make, model, color, vehicle_type FROM vehicles WHERE customer_id=? ORDER BY vehicle_id DESC", (user_id,))
-    vehicles = cur.fetchall()
+    vehicles = run_select("SELECT vehicle_id, plate_no, make, model, color, vehicle_type FROM vehicles WHERE customer_id=? ORDER BY vehicle_id DESC", (user_id,))
 
     with st.expander("Add Vehicle", expanded=False):
         c1, c2 = st.columns(2)
@@ -252,12 +364,13 @@ def page_customer_dashboard():
         vtype = c1.text_input("Vehicle Type (Car/SUV)", key="v_type")
         if st.button("Save Vehicle"):
             try:
-                q(conn, """
-                INSERT INTO vehicles(customer_id, plate_no, make, model, color, vehicle_type)
-                VALUES(?,?,?,?,?,?)
-                """, (user_id, plate_no.strip(), make.strip() or None, model.strip() or None,
-                      color.strip() or None, vtype.strip() or None))
-                conn.commit()
+                with transaction() as conn:
+                    q(conn, """
+                    INSERT INTO vehicles(customer_id, plate_no, make, model, color, vehicle_type)
+                    VALUES(?,?,?,?,?,?)
+                    """, (user_id, plate_no.strip(), make.strip() or None, model.strip() or None,
+                          color.strip() or None, vtype.strip() or None))
+                run_select.clear()
                 st.success("Vehicle added.")
                 st.rerun()
             except sqlite3.IntegrityError as e:
@@ -269,16 +382,16 @@ def page_customer_dashboard():
     else:
         st.info("No vehicles yet. Add one.")
 
-    st.markdown("---")
+@st.fragment
+def create_booking_fragment(user_id):
     st.markdown("### Create Booking")
-    pkgs = get_active_packages(conn)
+    vehicles = run_select("SELECT vehicle_id, plate_no FROM vehicles WHERE customer_id=? ORDER BY vehicle_id DESC", (user_id,))
+    pkgs = get_active_packages()
     if not vehicles:
         st.warning("Add a vehicle first to create a booking.")
-        conn.close()
         return
     if not pkgs:
         st.warning("No packages available.")
-        conn.close()
         return
 
     vehicle_map = {f"{v[1]} (ID {v[0]})": v[0] for v in vehicles}
@@ -293,32 +406,23 @@ def page_customer_dashboard():
     if st.button("Create Booking"):
         vehicle_id = vehicle_map[vehicle_choice]
         package_id = pkg_map[pkg_choice]
+        # initial stage: first stage in order (cached list is ordered by stage_order)
+        first_stage_id = get_stage_list()[0][0]
 
-        # initial stage: first stage in order
-        cur = q(conn, "SELECT stage_id FROM service_stages ORDER BY stage_order LIMIT 1")
-        first_stage_id = cur.fetchone()[0]
+        # the unpaid payment record is created by trg_bookings_create_payment
+        with transaction() as conn:
+            booking_id = q(conn, SQL_INSERT_BOOKING, (user_id, vehicle_id, package_id, now_str(), scheduled.strip() or None, "Booked", first_stage_id, notes.strip() or None)).fetchone()[0]
+        run_select.clear()
 
-        q(conn, """
-        INSERT INTO bookings(customer_id, vehicle_id, package_id, booking_datetime, scheduled_datetime, status, current_stage_id, notes)
-        VALUES(?,?,?,?,?,?,?,?)
-        """, (user_id, vehicle_id, package_id, now_str(), scheduled.strip() or None, "Booked", first_stage_id, notes.strip() or None))
-        booking_id = q(conn, "SELECT last_insert_rowid()").fetchone()[0]
-
-        # create unpaid payment record (optional but matches requirement)
-        pkg_price = q(conn, "SELECT price FROM packages WHERE package_id=?", (package_id,)).fetchone()[0]
-        q(conn, """
-        INSERT INTO payments(booking_id, amount, method, payment_status, paid_at)
-        VALUES(?,?,?,?,?)
-        """, (booking_id, float(pkg_price), "Cash", "Unpaid", None))
-
-        conn.commit()
         st.success(f"Booking created (ID {booking_id}).")
         st.rerun()
 
-    st.markdown("---")
+@st.fragment
+def my_bookings_fragment(user_id):
     st.markdown("### My Bookings (Live Status + History)")
 
-    cur = q(conn, """
+    page_key = f"my_bookings_pages_{user_id}"
+    bookings = run_select("""
     SELECT b.booking_id, b.booking_datetime, b.status,
            v.plate_no, p.package_name, p.price,
            s.stage_name
@@ -326,44 +430,53 @@ def page_customer_dashboard():
     JOIN vehicles v ON v.vehicle_id=b.vehicle_id
     JOIN packages p ON p.package_id=b.package_id
     LEFT JOIN service_stages s ON s.stage_id=b.current_stage_id
-    WHERE b.customer_id=?
+    WHERE b.customer_id=? AND b.booking_id < ?
     ORDER BY b.booking_id DESC
-    """, (user_id,))
-    bookings = cur.fetchall()
+    LIMIT ?
+    """, (user_id, page_cursor(page_key, 2**63 - 1), PAGE_SIZE + 1))
+    bookings, has_more = bookings[:PAGE_SIZE], len(bookings) > PAGE_SIZE
 
     if not bookings:
         st.info("No bookings yet.")
-        conn.close()
         return
 
-    for b in bookings:
-        bid, bdt, status, plate, pkg, price, stage = b
-        with st.expander(f"Booking #{bid} | {plate} | {pkg} | Status: {status} | Stage: {stage}"):
-            st.write(f"**Booking Time:** {bdt}")
-            st.write(f"**Package:** {pkg} (Rs {price})")
-            st.write(f"**Current Stage:** {stage}")
+    # One dataframe widget for the whole page instead of an expander + writes per booking
+    df = pd.DataFrame(bookings, columns=["Booking #", "Booked At", "Status", "Plate", "Package", "Price (Rs)", "Stage"])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    page_buttons(page_key, bookings, has_more, scope="fragment")
+
+    # Payment + stage history are only loaded for the booking being inspected
+    bid = st.selectbox("Inspect booking", df["Booking #"].tolist(), key=f"inspect_booking_{user_id}")
+
+    pay = run_select_one("SELECT amount, method, payment_status, paid_at FROM payments WHERE booking_id=?", (bid,))
+    if pay:
+        st.write(f"**Payment:** Rs {pay[0]} | Method: {pay[1]} | Status: {pay[2]} | Paid At: {pay[3] or '-'}")
+
+    st.markdown("**Stage History:**")
+    hist = run_select("""
+    SELECT ss.stage_name, h.start_time, h.end_time, u.full_name
+    FROM booking_stage_history h
+    JOIN service_stages ss ON ss.stage_id=h.stage_id
+    JOIN users u ON u.user_id=h.updated_by_staff_id
+    WHERE h.booking_id=?
+    ORDER BY h.history_id DESC
+    """, (bid,))
+
+    if hist:
+        for row in hist:
+            st.write(f"- {row[0]} | start: {row[1]} | end: {row[2] or '-'} | by: {row[3]}")
+    else:
+        st.info("No history yet (staff will update stages).")
 
-            pay = q(conn, "SELECT amount, method, payment_status, paid_at FROM payments WHERE booking_id=?", (bid,)).fetchone()
-            if pay:
-                st.write(f"**Payment:** Rs {pay[0]} | Method: {pay[1]} | Status: {pay[2]} | Paid At: {pay[3] or '-'}")
-
-            st.markdown("**Stage History:**")
-            hist = q(conn, """
-            SELECT ss.stage_name, h.start_time, h.end_time, u.full_name
-            FROM booking_stage_history h
-            JOIN service_stages ss ON ss.stage_id=h.stage_id
-            JOIN users u ON u.user_id=h.updated_by_staff_id
-            WHERE h.booking_id=?
-            ORDER BY h.history_id DESC
-            """, (bid,)).fetchall()
-
-            if hist:
-                for row in hist:
-                    st.write(f"- {row[0]} | start: {row[1]} | end: {row[2] or '-'} | by: {row[3]}")
-            else:
-                st.info("No history yet (staff will update stages).")
+def page_customer_dashboard():
+    st.subheader("Customer Dashboard")
+    user_id = st.session_state["user"]["user_id"]
 
-    conn.close()
+    vehicles_fragment(user_id)
+    st.markdown("---")
+    create_booking_fragment(user_id)
+    st.markdown("---")
+    my_bookings_fragment(user_id)
 
 
 # =========================
@@ -371,7 +484,6 @@ def page_customer_dashboard():
 # =========================
 def page_staff_dashboard():
     st.subheader("Admin/Staff Dashboard")
-    conn = get_conn()
 
     # Tabs
     tab1, tab2, tab3, tab4 = st.tabs(["Active Bookings", "Update Stages", "Assignments", "Packages & Staff"])
@@ -381,7 +493,8 @@ def page_staff_dashboard():
     # -------------------------
     with tab1:
         st.markdown("### Active / In Progress Bookings")
-        rows = q(conn, """
+        page_key = "active_bookings_pages"
+        rows = run_select("""
         SELECT b.booking_id, b.booking_datetime, b.status,
                c.full_name, v.plate_no, p.package_name,
                ss.stage_name
@@ -390,42 +503,45 @@ def page_staff_dashboard():
         JOIN vehicles v ON v.vehicle_id=b.vehicle_id
         JOIN packages p ON p.package_id=b.package_id
         LEFT JOIN service_stages ss ON ss.stage_id=b.current_stage_id
-        WHERE b.status IN ('Booked','InProgress')
+        WHERE b.status IN ('Booked','InProgress') AND b.booking_id > ?
         ORDER BY b.booking_id ASC
-        """).fetchall()
+        LIMIT ?
+        """, (page_cursor(page_key, 0), PAGE_SIZE + 1))
+        rows, has_more = rows[:PAGE_SIZE], len(rows) > PAGE_SIZE
 
         if not rows:
             st.info("No active bookings.")
         else:
             for r in rows:
                 st.write(f"• **#{r[0]}** | {r[3]} | {r[4]} | {r[5]} | Status: {r[2]} | Stage: {r[6]} | Time: {r[1]}")
+        page_buttons(page_key, rows, has_more)
 
     # -------------------------
     # UPDATE STAGES
     # -------------------------
     with tab2:
         st.markdown("### Update Booking Stage (creates history)")
-        bookings = q(conn, """
-        SELECT booking_id FROM bookings
+        # current stage/status come with the list, so picking a booking needs no extra lookup
+        bookings = run_select("""
+        SELECT booking_id, current_stage_id, status FROM bookings
         WHERE status IN ('Booked','InProgress')
         ORDER BY booking_id ASC
-        """).fetchall()
+        """)
         if not bookings:
             st.info("No bookings to update.")
         else:
-            booking_ids = [b[0] for b in bookings]
-            bid = st.selectbox("Select Booking", booking_ids)
+            current_by_id = {b[0]: b[1:] for b in bookings}
+            bid = st.selectbox("Select Booking", list(current_by_id.keys()))
 
-            stages = get_stage_list(conn)
-            stage_map = {name: sid for sid, name in stages}
+            stages = get_stage_list()
+            stage_map = {name: sid for sid, name, _ in stages}
             stage_names = list(stage_map.keys())
+            # Stage id -> (name, order) and the final order, from the cached list (no SQL lookups)
+            stages_by_id = {sid: (name, order) for sid, name, order in stages}
+            max_order = max(order for _, order in stages_by_id.values())
 
-            current = q(conn, """
-            SELECT current_stage_id, status FROM bookings WHERE booking_id=?
-            """, (bid,)).fetchone()
-            current_stage_id, current_status = current
-            current_stage_name = q(conn, "SELECT stage_name FROM service_stages WHERE stage_id=?", (current_stage_id,)).fetchone()
-            current_stage_name = current_stage_name[0] if current_stage_name else "None"
+            current_stage_id, current_status = current_by_id[bid]
+            current_stage_name = stages_by_id[current_stage_id][0] if current_stage_id in stages_by_id else "None"
 
             st.write(f"Current: **{current_stage_name}** | Booking Status: **{current_status}**")
 
@@ -434,44 +550,33 @@ def page_staff_dashboard():
 
             if st.button("Update Stage"):
                 staff_id = st.session_state["user"]["user_id"]
+                ts = now_str()  # one timestamp: previous stage's end == new stage's start
 
-                # End previous history row if requested
-                if end_prev and current_stage_id is not None:
-                    q(conn, """
-                    UPDATE booking_stage_history
-                    SET end_time=?
-                    WHERE booking_id=? AND stage_id=? AND end_time IS NULL
-                    """, (now_str(), bid, current_stage_id))
-
-                new_stage_id = stage_map[new_stage_name]
-
-                # Set booking status automatically
-                new_booking_status = "InProgress"
-                # If completed stage selected
-                stage_order = q(conn, "SELECT stage_order FROM service_stages WHERE stage_id=?", (new_stage_id,)).fetchone()[0]
-                max_order = q(conn, "SELECT MAX(stage_order) FROM service_stages").fetchone()[0]
-                if stage_order == max_order:
-                    new_booking_status = "Completed"
-
-                # Update booking
-                q(conn, """
-                UPDATE bookings
-                SET current_stage_id=?, status=?
-                WHERE booking_id=?
-                """, (new_stage_id, new_booking_status, bid))
-
-                # Add history row
-                q(conn, """
-                INSERT INTO booking_stage_history(booking_id, stage_id, start_time, end_time, updated_by_staff_id)
-                VALUES(?,?,?,?,?)
-                """, (bid, new_stage_id, now_str(), None, staff_id))
-
-                # If completed, mark payment as Paid automatically? (optional)
-                if new_booking_status == "Completed":
-                    # Keep as-is; staff can update payment in Assignments tab if needed
-                    pass
-
-                conn.commit()
+                with transaction() as conn:
+                    # End previous history row if requested
+                    if end_prev and current_stage_id is not None:
+                        q(conn, SQL_END_STAGE, (ts, bid, current_stage_id))
+
+                    new_stage_id = stage_map[new_stage_name]
+
+                    # Set booking status automatically
+                    new_booking_status = "InProgress"
+                    # If completed stage selected
+                    if stages_by_id[new_stage_id][1] == max_order:
+                        new_booking_status = "Completed"
+
+                    # Update booking
+                    q(conn, SQL_UPDATE_BOOKING_STAGE, (new_stage_id, new_booking_status, bid))
+
+                    # Add history row
+                    q(conn, SQL_INSERT_STAGE_HISTORY, (bid, new_stage_id, ts, None, staff_id))
+
+                    # If completed, mark payment as Paid automatically? (optional)
+                    if new_booking_status == "Completed":
+                        # Keep as-is; staff can update payment in Assignments tab if needed
+                        pass
+
+                run_select.clear()
                 st.success("Stage updated + history saved.")
                 st.rerun()
 
@@ -482,40 +587,36 @@ def page_staff_dashboard():
         st.markdown("### Staff Assignments & Payments")
 
         # Assign staff to booking
-        booking_ids = [r[0] for r in q(conn, "SELECT booking_id FROM bookings ORDER BY booking_id DESC").fetchall()]
+        booking_ids = [r[0] for r in run_select("SELECT booking_id FROM bookings ORDER BY booking_id DESC")]
         if booking_ids:
             bsel = st.selectbox("Booking ID", booking_ids, key="assign_booking")
         else:
             st.info("No bookings exist yet.")
             bsel = None
 
-        staff_rows = q(conn, "SELECT user_id, full_name, role FROM users WHERE role IN ('Staff','Admin') ORDER BY full_name").fetchall()
+        staff_rows = run_select("SELECT user_id, full_name, role FROM users WHERE role IN ('Staff','Admin') ORDER BY full_name")
         staff_map = {f"{s[1]} ({s[2]}) [ID {s[0]}]": s[0] for s in staff_rows}
 
         if bsel and staff_rows:
             chosen_staff = st.multiselect("Assign Staff", list(staff_map.keys()))
             if st.button("Save Assignment"):
-                for label in chosen_staff:
-                    sid = staff_map[label]
-                    try:
-                        q(conn, """
-                        INSERT INTO booking_staff_assignment(booking_id, staff_id, assigned_at)
-                        VALUES(?,?,?)
-                        """, (bsel, sid, now_str()))
-                    except sqlite3.IntegrityError:
-                        pass
-                conn.commit()
+                ts = now_str()
+                rows = [(bsel, staff_map[label], ts) for label in chosen_staff]
+                with transaction() as conn:
+                    # already-assigned staff are skipped by the (booking_id, staff_id) primary key
+                    conn.executemany(SQL_INSERT_ASSIGNMENT, rows)
+                run_select.clear()
                 st.success("Assignments updated.")
                 st.rerun()
 
             st.markdown("**Current Assigned Staff:**")
-            assigned = q(conn, """
+            assigned = run_select("""
             SELECT u.full_name, u.role, a.assigned_at
             FROM booking_staff_assignment a
             JOIN users u ON u.user_id=a.staff_id
             WHERE a.booking_id=?
             ORDER BY a.assigned_at DESC
-            """, (bsel,)).fetchall()
+            """, (bsel,))
             if assigned:
                 for a in assigned:
                     st.write(f"- {a[0]} ({a[1]}) | assigned_at: {a[2]}")
@@ -524,19 +625,20 @@ def page_staff_dashboard():
 
             st.markdown("---")
             st.markdown("**Payment Update (for selected booking):**")
-            pay = q(conn, "SELECT amount, method, payment_status, paid_at FROM payments WHERE booking_id=?", (bsel,)).fetchone()
+            pay = run_select_one("SELECT amount, method, payment_status, paid_at FROM payments WHERE booking_id=?", (bsel,))
             if pay:
                 amount, method, pstatus, paid_at = pay
                 c1, c2 = st.columns(2)
                 new_method = c1.selectbox("Method", ["Cash", "Card", "Online"], index=["Cash","Card","Online"].index(method))
                 new_status = c2.selectbox("Payment Status", ["Unpaid", "Paid", "Partial", "Refunded"], index=["Unpaid","Paid","Partial","Refunded"].index(pstatus))
-                paid_time = now_str() if new_status == "Paid" else None
                 if st.button("Update Payment"):
-                    q(conn, """
-                    UPDATE payments SET method=?, payment_status=?, paid_at=?
-                    WHERE booking_id=?
-                    """, (new_method, new_status, paid_time, bsel))
-                    conn.commit()
+                    paid_time = now_str() if new_status == "Paid" else None
+                    with transaction() as conn:
+                        q(conn, """
+                        UPDATE payments SET method=?, payment_status=?, paid_at=?
+                        WHERE booking_id=?
+                        """, (new_method, new_status, paid_time, bsel))
+                    run_select.clear()
                     st.success("Payment updated.")
                     st.rerun()
             else:
@@ -547,7 +649,7 @@ def page_staff_dashboard():
     # -------------------------
     with tab4:
         st.markdown("### Manage Packages")
-        pkgs = q(conn, "SELECT package_id, package_name, price, duration_minutes, is_active FROM packages ORDER BY package_id DESC").fetchall()
+        pkgs = run_select("SELECT package_id, package_name, price, duration_minutes, is_active FROM packages ORDER BY package_id DESC")
         for p in pkgs:
             st.write(f"• **{p[1]}** | Rs {p[2]} | {p[3]} min | Active: {bool(p[4])} | ID: {p[0]}")
 
@@ -558,11 +660,13 @@ def page_staff_dashboard():
             active = st.checkbox("Active", value=True, key="pkg_active")
             if st.button("Create Package"):
                 try:
-                    q(conn, """
-                    INSERT INTO packages(package_name, price, duration_minutes, is_active)
-                    VALUES(?,?,?,?)
-                    """, (n.strip(), float(pr), int(dm), 1 if active else 0))
-                    conn.commit()
+                    with transaction() as conn:
+                        q(conn, """
+                        INSERT INTO packages(package_name, price, duration_minutes, is_active)
+                        VALUES(?,?,?,?)
+                        """, (n.strip(), float(pr), int(dm), 1 if active else 0))
+                    get_active_packages.clear()
+                    run_select.clear()
                     st.success("Package created.")
                     st.rerun()
                 except sqlite3.IntegrityError as e:
@@ -580,17 +684,17 @@ def page_staff_dashboard():
                 st.error("Name, phone and password required.")
             else:
                 try:
-                    q(conn, """
-                    INSERT INTO users(full_name, phone, email, password_hash, role, created_at)
-                    VALUES(?,?,?,?,?,?)
-                    """, (nm.strip(), ph.strip(), em.strip() or None, hash_password(pw.strip()), rl, now_str()))
-                    conn.commit()
+                    with transaction() as conn:
+                        q(conn, """
+                        INSERT INTO users(full_name, phone, email, password_hash, role, created_at)
+                        VALUES(?,?,?,?,?,?)
+                        """, (nm.strip(), ph.strip(), em.strip() or None, hash_password(pw.strip()), rl, now_str()))
+                    run_select.clear()
                     st.success("Staff/Admin user created.")
                     st.rerun()
                 except sqlite3.IntegrityError as e:
                     st.error(f"Could not create user: {e}")
 
-    conn.close()
 
 
 # =========================
@@ -640,7 +744,7 @@ def logout_button():
 
 def main():
     st.set_page_config(page_title=APP_TITLE, layout="wide")
-    init_db()
+    init_db_once()
 
     st.title(APP_TITLE)
     st.caption("Based on your DB proposal requirements: booking + packages + live status stages + history + payment + staff assignment. " 